@@ -1,3 +1,7 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 from google import genai
 from google.genai import types
 from pydantic import BaseModel
@@ -6,6 +10,13 @@ from typing import Type, Optional, List, Dict
 
 from core.log import LOG
 from core.files import get_style_guides_parts
+from core.schemas import FinalDecision
+
+# Resource names of caches created by previous runs. If a run dies without
+# reaching cleanup_caches, the server-side caches stay alive until their TTL;
+# probing this snapshot lets the next invocation reuse them instead of paying
+# the cache-creation premium again (and leaking the old ones).
+__CACHE_STATE_PATH = "./.cache/engine_state.json"
 
 # 1. The Singleton Client
 # This executes once when the module is imported.
@@ -144,17 +155,21 @@ class VertexEngine:
                 return 8_192
         return 1_048_576
 
-    def generate(self, contents: List[types.Part]) -> types.GenerateContentResponse:
+    def generate(self, contents: List[types.Part],
+                 config: Optional[types.GenerateContentConfig] = None) -> types.GenerateContentResponse:
         """
         Executes a generation request using the instance's unique config and the shared client.
         Supposed for the amount of tokens less than maximal.
         :param contents: A list of Parts (text, images, PDFs) to send to the model.
+        :param config: Optional per-call config overriding the engine's own. Engines are
+            shared across threads, so callers needing call-specific settings (e.g. a
+            submission cache) pass a copy here instead of mutating self.config.
         :return: The GenerateContentResponse from the API.
         """
         return self.client.models.generate_content(
             model=self.model_id,
             contents=contents,
-            config=self.config
+            config=config if config is not None else self.config
         )
 
     def count_tokens(self, contents: List[types.Part]) -> int:
@@ -212,21 +227,29 @@ def create_engine(model_id: str = 'gemini-2.5-flash', pydantic_model: Type[BaseM
                   search_included: bool = False, upload_style_guides: bool = False, ttl_seconds: str ="300s") -> VertexEngine:
 
     engine = VertexEngine(model_id=model_id)
-    
+
     engine.set_schema(schema=pydantic_model)
 
+    if pydantic_model is FinalDecision:
+        # The final decision must be deterministic: T=0 removes format drift
+        # (fewer retries) and keeps the output byte-stable for caching.
+        engine.set_temperature(temp=0.0)
+
     if upload_style_guides:
         style_guides = get_style_guides_parts()
         if style_guides:
             style_guides.insert(0, types.Part.from_text(text=system_instruction))
-            LOG.info(f"Creating context cache with style guides for {pydantic_model.__name__}")
-            cache = engine.create_cache(
-                contents=style_guides,
-                display_name=f"style_guides",
-                ttl_seconds=ttl_seconds
-            )
+            cache = __probe_persisted_cache(engine, pydantic_model.__name__)
+            if cache is None:
+                LOG.info(f"Creating context cache with style guides for {pydantic_model.__name__}")
+                cache = engine.create_cache(
+                    contents=style_guides,
+                    display_name=f"style_guides",
+                    ttl_seconds=ttl_seconds
+                )
             engine.set_cache(cache.name)
             __CACHES[pydantic_model.__name__] = cache
+            __persist_cache_names()
         else:
             # Fallback to non-cached settings
             engine.set_system_instruction(instruction=system_instruction)
@@ -254,6 +277,83 @@ def create_engine(model_id: str = 'gemini-2.5-flash', pydantic_model: Type[BaseM
     return engine
 
 
+def __load_persisted_cache_names() -> Dict[str, str]:
+    """Loads the cache-name snapshot left behind by a previous run, if any."""
+    try:
+        with open(__CACHE_STATE_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+__PERSISTED_CACHE_NAMES: Dict[str, str] = __load_persisted_cache_names()
+
+
+def __reap_stale_submission_caches() -> None:
+    """Deletes per-submission caches left behind by a crashed run.
+
+    Style-guide caches are re-adopted via __probe_persisted_cache, but
+    submission caches are keyed by documents the next run may never touch
+    again - without this they sit on the server until their TTL (hours on
+    the evaluation path), and the first __persist_cache_names overwrite
+    would orphan their names for good.
+    """
+    stale = [key for key in __PERSISTED_CACHE_NAMES if key.startswith("submission:")]
+    for key in stale:
+        cache_name = __PERSISTED_CACHE_NAMES.pop(key)
+        try:
+            LOG.info(f"Deleting stale submission cache {cache_name} from a previous run")
+            _SHARED_CLIENT.caches.delete(name=cache_name)
+        except Exception:
+            # Already expired or deleted; either way it no longer needs tracking.
+            pass
+
+
+__reap_stale_submission_caches()
+
+
+def __persist_cache_names() -> None:
+    """Snapshots the resource names of live caches to disk."""
+    try:
+        os.makedirs(os.path.dirname(__CACHE_STATE_PATH), exist_ok=True)
+        with open(__CACHE_STATE_PATH, "w") as f:
+            json.dump({key: cache.name for key, cache in __CACHES.items() if cache}, f)
+    except OSError as e:
+        LOG.warning(f"Could not persist cache names: {e}")
+
+
+def __probe_persisted_cache(engine: "VertexEngine", key: str) -> Optional[types.CachedContent]:
+    """
+    Tries to fetch a still-live cache left behind by a previous run.
+
+    :param engine: Engine whose client performs the lookup.
+    :param key: The persisted cache key (e.g., the pydantic model name).
+    :return: The live CachedContent, or None if it expired or never existed.
+    """
+    cache_name = __PERSISTED_CACHE_NAMES.get(key)
+    if not cache_name:
+        return None
+
+    try:
+        cache = engine.client.caches.get(name=cache_name)
+        LOG.info(f"Reusing persisted context cache {cache_name} for {key}")
+        return cache
+    except Exception:
+        return None
+
+
+def register_cache(key: str, cache: types.CachedContent) -> None:
+    """
+    Registers an externally created context cache (e.g., a per-submission
+    document cache) so that cleanup_caches deletes it on program exit.
+
+    :param key: Unique key identifying the cache.
+    :param cache: The CachedContent object to track.
+    """
+    __CACHES[key] = cache
+    __persist_cache_names()
+
+
 def cleanup_caches() -> None:
     """
     Cleans up the shared cache to free resources.
@@ -263,15 +363,28 @@ def cleanup_caches() -> None:
 
     :return: None
     """
-    engine = VertexEngine()
-    for cache in __CACHES.values():
-        if cache is None:
-            LOG.info("No cache to clean up.")
-            return
-
-        try:
-            LOG.info(f"Deleting cache: {cache.name}")
-            engine.client.caches.delete(name=cache.name)
-            LOG.info("Cache cleanup completed successfully.")
-        except Exception as e:
-            LOG.error(f"Error during cache cleanup: {e}")
+    live_caches = [cache for cache in __CACHES.values() if cache is not None]
+    if not live_caches:
+        LOG.info("No cache to clean up.")
+    else:
+        def __delete_cache(cache: types.CachedContent) -> None:
+            try:
+                LOG.info(f"Deleting cache: {cache.name}")
+                # The module-level client is reused directly: constructing a
+                # fresh VertexEngine here would redo auth/client init at exit.
+                _SHARED_CLIENT.caches.delete(name=cache.name)
+            except Exception as e:
+                LOG.error(f"Error during cache cleanup: {e}")
+
+        # Each delete is an independent REST call; issuing them concurrently
+        # cuts shutdown from K round trips to roughly one.
+        with ThreadPoolExecutor(max_workers=8, thread_name_prefix="CacheCleanup") as executor:
+            list(executor.map(__delete_cache, live_caches))
+        LOG.info("Cache cleanup completed successfully.")
+
+    # The tracked caches are gone; drop the on-disk snapshot so the next run
+    # does not probe dead names.
+    try:
+        os.remove(__CACHE_STATE_PATH)
+    except OSError:
+        pass
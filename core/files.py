@@ -1,14 +1,137 @@
+import hashlib
 import mimetypes
 import os
-from typing import List, Union, Optional
+import threading
+from typing import Dict, List, Tuple, Union, Optional
 from google.genai import types
 
 from core.log import LOG
 from core.constants import SKIP_DIRS, STYLE_GUIDES_DEFAULT, SUPPORTED_MIME_TYPES
 
+# Load the mimetypes database eagerly at import time; otherwise the first
+# guess_type call pays for the lazy file-parsing init inside a worker thread.
+mimetypes.init()
+
 
 __STYLE_GUIDES_CACHE: List[types.Part] = []
 
+# URI Parts of large supplemental files already uploaded via the File API,
+# keyed on (path, size, mtime) so a changed file triggers a fresh upload.
+# A None entry means the upload was attempted and failed (do not retry).
+__UPLOADED_PARTS_CACHE: Dict[Tuple[str, int, float], Optional[types.Part]] = {}
+__UPLOAD_MISS = object()  # sentinel: distinguishes "never attempted" from a stored None
+
+# Files above this size are uploaded once and referenced by URI instead of
+# being inlined into every agent's prompt (O(total size) RAM and repeated
+# multi-MB payloads on the wire).
+LARGE_FILE_THRESHOLD = 10 * 1024 * 1024  # 10 MiB
+
+# Hard cap on a single supplemental file. Anything bigger (rogue archives,
+# raw datasets) is skipped up front: it would blow past the request budget
+# inline and is not worth the upload time via the File API either.
+MAX_SUPPLEMENTAL_FILE_BYTES = 100 * 1024 * 1024  # 100 MiB
+
+
+def __upload_large_file(s_file: str, s_file_size: int, mime_type: str) -> Optional[types.Part]:
+    """
+    Uploads a large supplemental file once and returns a Part referencing its URI.
+
+    The resulting Part is cached so every agent analyzing the same submission
+    reuses the single upload instead of re-sending the bytes inline.
+
+    :param s_file: Path to the file.
+    :param s_file_size: Size of the file in bytes.
+    :param mime_type: The mime type to attach to the uploaded reference.
+    :return: A URI-referencing Part, or None if the upload failed.
+    """
+    # Local import to avoid a circular module dependency (config imports files).
+    from core.config import _SHARED_CLIENT
+
+    # The Files API only exists on the Gemini Developer API; a Vertex client
+    # raises for every upload, so don't burn an attempt (and a warning per
+    # agent call) on a path that can never succeed there.
+    if getattr(_SHARED_CLIENT, "vertexai", False):
+        LOG.debug(f"File API unavailable on Vertex; sending '{s_file}' inline.")
+        return None
+
+    cache_key = (s_file, s_file_size, os.path.getmtime(s_file))
+    cached_part = __UPLOADED_PARTS_CACHE.get(cache_key, __UPLOAD_MISS)
+    if cached_part is not __UPLOAD_MISS:
+        return cached_part
+
+    try:
+        uploaded_file = _SHARED_CLIENT.files.upload(file=s_file)
+        part = types.Part.from_uri(file_uri=uploaded_file.uri, mime_type=mime_type)
+    except Exception as e:
+        LOG.warning(f"File API upload failed for '{s_file}': {e}. Falling back to inline bytes.")
+        # Negative-cache the failure: without it every agent call retries the
+        # doomed upload and repeats the warning.
+        __UPLOADED_PARTS_CACHE[cache_key] = None
+        return None
+
+    __UPLOADED_PARTS_CACHE[cache_key] = part
+    return part
+
+
+# Ready-made Parts for main papers, keyed on (path, size, mtime). Bounded so
+# a long evaluation run over many submissions does not pin every PDF in RAM.
+# The lock guards the evict+insert pair: parallel evaluation calls this from
+# several threads, and racing evictions can pop the same key twice.
+__MAIN_PAPER_PARTS_CACHE: Dict[Tuple[str, int, float], types.Part] = {}
+__MAIN_PAPER_PARTS_CACHE_LIMIT = 8
+__MAIN_PAPER_PARTS_CACHE_LOCK = threading.Lock()
+
+
+def get_main_paper_part(pdf_path: str) -> types.Part:
+    """
+    Returns the Part for a submission's main PDF, cached on (path, size, mtime).
+
+    Every agent analyzing the same submission reuses a single disk read and,
+    for PDFs above LARGE_FILE_THRESHOLD, a single File API upload, instead of
+    re-reading and re-uploading the identical bytes once per agent call.
+
+    :param pdf_path: Path to the main_paper.pdf of the submission.
+    :return: A Part carrying the PDF (inline bytes or an uploaded URI).
+    """
+    stat_result = os.stat(pdf_path)
+    cache_key = (pdf_path, stat_result.st_size, stat_result.st_mtime)
+    part = __MAIN_PAPER_PARTS_CACHE.get(cache_key)
+    if part:
+        return part
+
+    part = None
+    if stat_result.st_size > LARGE_FILE_THRESHOLD:
+        part = __upload_large_file(s_file=pdf_path, s_file_size=stat_result.st_size,
+                                   mime_type="application/pdf")
+    if part is None:
+        with open(pdf_path, "rb") as f:
+            part = types.Part.from_bytes(
+                data=f.read(),
+                mime_type="application/pdf"
+            )
+
+    with __MAIN_PAPER_PARTS_CACHE_LOCK:
+        while len(__MAIN_PAPER_PARTS_CACHE) >= __MAIN_PAPER_PARTS_CACHE_LIMIT:
+            # Evict the oldest entry (dicts preserve insertion order).
+            __MAIN_PAPER_PARTS_CACHE.pop(next(iter(__MAIN_PAPER_PARTS_CACHE)))
+        __MAIN_PAPER_PARTS_CACHE[cache_key] = part
+    return part
+
+
+def __stream_digest(s_file: str, chunk_size: int = 1024 * 1024) -> bytes:
+    """
+    Computes a blake2b content digest without loading the whole file into RAM.
+
+    :param s_file: Path to the file to hash.
+    :param chunk_size: Read granularity (1 MiB keeps syscall overhead negligible).
+    :return: The 16-byte digest of the file contents.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(s_file, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.digest()
+
 
 def get_style_guides_parts() -> List[types.Part]:
     """Get style guides as a list of Parts, using cache if available."""
@@ -23,19 +146,6 @@ def get_style_guides_parts() -> List[types.Part]:
                 ))
     return __STYLE_GUIDES_CACHE
 
-def add_supplemental_files(supp_path: str) -> List[str]:
-    """
-    Recursively gathers supplemental file paths from the specified directory.
-
-    :param supp_path: The root directory to search for supplemental files.
-    :return: A list of absolute or relative file paths.
-    """
-    all_files = []
-    for root, _, files in os.walk(supp_path):
-        for file in files:
-            all_files.append(os.path.join(root, file))
-    return all_files
-
 def process_supplemental_files(supp_path: str, prompt_parts: List[types.Part]) -> None:
     """
     Reads supplemental files from a directory and appends them as Parts to the prompt list.
@@ -46,27 +156,77 @@ def process_supplemental_files(supp_path: str, prompt_parts: List[types.Part]) -
     if os.path.exists(supp_path):
         prompt_parts.append(types.Part.from_text(text="Here are the supplemental files for the paper"))
         supplemental_files = add_supplemental_files(supp_path)
-        
-        for s_file in supplemental_files:
+        # Maps blake2b digest of file bytes -> first file path seen with those bytes.
+        # Duplicate copies are replaced by a short text Part so identical bytes are
+        # never uploaded (and tokenized) twice in the same prompt.
+        seen_digests: Dict[bytes, str] = {}
+
+        for s_file, s_file_size in supplemental_files:
+            # Empty files carry no content: skip them before paying for the
+            # label Part, the mime lookup and the open/read syscalls.
+            if s_file_size == 0:
+                LOG.debug(f"The file '{s_file}' is empty. Skipping.")
+                continue
+
+            # Oversize files are rejected on the stat alone — before any
+            # open/read allocates hundreds of MB that can never be sent.
+            if s_file_size > MAX_SUPPLEMENTAL_FILE_BYTES:
+                LOG.warning(f"The file '{s_file}' is {s_file_size} bytes "
+                            f"(limit {MAX_SUPPLEMENTAL_FILE_BYTES}). Skipping.")
+                continue
+
             s_file_mime = get_optimized_fallback_mime(s_file)
-            prompt_parts.append(types.Part.from_text(text=f"The file {s_file}:"))
+
+            if s_file_size > LARGE_FILE_THRESHOLD and s_file_mime:
+                # Stream-hash before uploading so a duplicate large file
+                # (e.g. the same video in two folders) costs one disk pass
+                # instead of a second multi-MB upload.
+                digest = __stream_digest(s_file)
+                first_path = seen_digests.get(digest)
+                if first_path:
+                    LOG.debug(f"The file '{s_file}' duplicates '{first_path}'. Uploading a reference instead.")
+                    prompt_parts.append(types.Part.from_text(text=f"{s_file} is identical to {first_path}"))
+                    continue
+                uri_part = __upload_large_file(s_file=s_file, s_file_size=s_file_size, mime_type=s_file_mime)
+                if uri_part:
+                    seen_digests[digest] = s_file
+                    prompt_parts.append(types.Part.from_text(text=f"The file {s_file}:"))
+                    prompt_parts.append(uri_part)
+                    continue
 
             with open(s_file, "rb") as f:
                 f_read = f.read()
-                if len(f_read) <= 0:
-                    continue
 
-                if not s_file_mime:
-                    file_part = try_decoding(binary_data=f_read)
-                    if not file_part:
-                        LOG.debug(f"The file '{s_file}' couldn't be uploaded due to unsupported mime_type.")
-                        continue
-                    prompt_parts.append(file_part)
-                else:
+            digest = hashlib.blake2b(f_read, digest_size=16).digest()
+            first_path = seen_digests.get(digest)
+            if first_path:
+                LOG.debug(f"The file '{s_file}' duplicates '{first_path}'. Uploading a reference instead.")
+                prompt_parts.append(types.Part.from_text(text=f"{s_file} is identical to {first_path}"))
+                continue
+            seen_digests[digest] = s_file
+
+            if not s_file_mime or s_file_mime == 'text/plain':
+                file_part = try_decoding(binary_data=f_read)
+                if file_part:
+                    # Fold the label into the decoded text: one Part instead of
+                    # a label Part plus a content Part halves the Part count
+                    # for text-heavy supplemental folders.
+                    prompt_parts.append(types.Part.from_text(text=f"The file {s_file}:\n{file_part.text}"))
+                elif s_file_mime:
+                    # Claimed to be text but not decodable: ship the raw bytes.
+                    prompt_parts.append(types.Part.from_text(text=f"The file {s_file}:"))
                     prompt_parts.append(types.Part.from_bytes(
                         data=f_read,
                         mime_type=s_file_mime
                     ))
+                else:
+                    LOG.debug(f"The file '{s_file}' couldn't be uploaded due to unsupported mime_type.")
+            else:
+                prompt_parts.append(types.Part.from_text(text=f"The file {s_file}:"))
+                prompt_parts.append(types.Part.from_bytes(
+                    data=f_read,
+                    mime_type=s_file_mime
+                ))
 
 def get_optimized_fallback_mime(file_path: str) -> Optional[str]:
     """
@@ -101,42 +261,80 @@ def get_optimized_fallback_mime(file_path: str) -> Optional[str]:
             return None  # Ultimate default for unknown binaries
 
 
+def __sniff_text_encoding(binary_data: bytes) -> Optional[str]:
+    """
+    Guesses a candidate text encoding from the leading magic bytes.
+
+    Rationale:
+    - A BOM identifies UTF-8/UTF-16 content immediately.
+    - NUL bytes in the leading window mean the data is almost certainly binary
+      (NUL is valid UTF-8, so a full decode would "succeed" and upload garbage).
+
+    :param binary_data: The binary data to sniff.
+    :return: A candidate encoding name, or None if the data looks binary.
+    """
+    if binary_data[:3] == b"\xef\xbb\xbf":
+        return 'utf-8-sig'
+    if binary_data[:2] in (b"\xff\xfe", b"\xfe\xff"):
+        return 'utf-16'
+    if b"\x00" in binary_data[:4096]:
+        return None
+    return 'utf-8'
+
+
 def try_decoding(binary_data: bytes) -> Optional[types.Part]:
     """
-    Attempts to decode binary data as UTF-8 text and return as a Part.
+    Attempts to decode binary data as text and return as a Part.
+
+    Sniffs the leading magic bytes first, so clearly-binary data skips the
+    full-buffer decode attempt entirely.
 
     :param binary_data: The binary data to decode.
     :return: A Part with text content if decoding succeeds, None otherwise.
     """
+    encoding = __sniff_text_encoding(binary_data)
+    if encoding is None:
+        return None
+
     try:
         # If it's YAML, Python, or Markdown, this works perfectly.
-        text_content = binary_data.decode('utf-8')
+        text_content = binary_data.decode(encoding)
         return types.Part.from_text(text=text_content)
     except UnicodeDecodeError:
         return None
 
 
-def add_supplemental_files(path_to_supplemental_files: Union[os.PathLike, str]) -> List[Union[os.PathLike, str]]:
+def add_supplemental_files(path_to_supplemental_files: Union[os.PathLike, str]) -> List[Tuple[str, int]]:
     """
     Recursively gathers all files from the supplemental files directory.
 
     Implementation Details:
-    - Uses os.walk to traverse the directory tree.
-    - Prunes the search tree by modifying 'dirs' in-place to skip hidden directories
-      and those listed in SKIP_DIRS (e.g., .venv, __pycache__).
+    - Uses os.scandir to traverse the directory tree, reusing the DirEntry stat
+      cache so the file size comes for free with the directory listing.
+    - Prunes the search tree by skipping hidden directories and those listed
+      in SKIP_DIRS (e.g., .venv, __pycache__).
     - Ignores hidden files (starting with '.').
 
     :param path_to_supplemental_files: Path to the directory containing supplemental materials.
-    :return: A list of full file paths.
+    :return: A list of (full file path, file size in bytes) tuples.
     """
     supplemental_files_paths = []
+    pending_dirs = [f"{path_to_supplemental_files}"]
 
-    for root, dirs, files in os.walk(f"{path_to_supplemental_files}"):
-        # Modifying dirs[:] in-place prunes the search tree
-        dirs[:] = [d for d in dirs if d not in SKIP_DIRS and not d.startswith('.') and not d.startswith("_")]
-
-        for file in files:
-            if not file.startswith("."):
-                supplemental_files_paths.append(os.path.join(root, file))
+    while pending_dirs:
+        current_dir = pending_dirs.pop()
+        with os.scandir(current_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in SKIP_DIRS and not entry.name.startswith("_"):
+                        pending_dirs.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    supplemental_files_paths.append((entry.path, entry.stat().st_size))
 
+    # Sort by path: os.scandir yields entries in filesystem order, which can
+    # differ between runs/hosts and would break the stable prompt prefix that
+    # implicit caching matches on.
+    supplemental_files_paths.sort()
     return supplemental_files_paths
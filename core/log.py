@@ -1,5 +1,8 @@
+import atexit
 import logging
 import sys
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
 from typing import Union
 
 # The logger to be used throughout the program
@@ -28,6 +31,14 @@ def configure_logging(level: Union[str, int]):
     stdout_handler.setFormatter(log_formatter)
     stdout_handler.setLevel(log_level)
 
+    # Worker threads only enqueue records; a single listener thread formats
+    # and writes them, so logging never serializes the thread pools on the
+    # stdout lock.
+    log_queue: "SimpleQueue[logging.LogRecord]" = SimpleQueue()
+    listener = QueueListener(log_queue, stdout_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
     LOG.setLevel(log_level)
-    LOG.addHandler(stdout_handler)
+    LOG.addHandler(QueueHandler(log_queue))
     LOG.debug("Initialized logging framework with level %s", log_level)
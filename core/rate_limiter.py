@@ -7,6 +7,7 @@ when calling the Google Gemini API.
 
 import time
 import functools
+import threading
 from typing import Callable, Any, Optional
 from tenacity import (
     retry,
@@ -118,3 +119,40 @@ def retry_with_backoff(func: Callable) -> Callable:
             )
 
     return error_handling_wrapper
+
+
+class TokenBucket:
+    """
+    Thread-safe token-bucket rate limiter.
+
+    Callers take one token before sending a request; tokens refill at `rate`
+    per second up to `capacity`. When the bucket is empty, the caller sleeps
+    just long enough for the next token — outside any other lock — so
+    concurrent requests are paced globally without serializing each other.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        :param rate: Sustained request rate in tokens (requests) per second.
+        :param capacity: Maximum burst size; defaults to `rate`.
+        """
+        self._rate = rate
+        self._capacity = capacity if capacity is not None else rate
+        self._tokens = self._capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Blocks until a token is available, then consumes it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._capacity,
+                                   self._tokens + (now - self._last_refill) * self._rate)
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                needed = (1 - self._tokens) / self._rate
+            # Sleep outside the lock so other threads can refill/consume.
+            time.sleep(needed)
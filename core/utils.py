@@ -1,35 +1,202 @@
-import time
+import hashlib
+import io
 from typing import List, Union, Dict, Type, Optional, Any
 import pydantic
 import threading
 from google.genai import types, chats, errors
 import os
 
-from core.config import VertexEngine, create_engine  # Import the configured LLM
+from core.config import VertexEngine, create_engine, register_cache  # Import the configured LLM
 from core.log import LOG
 from core.schemas import AnalysisReport, FinalDecision
 from core.metrics import increase_total_output_tokens, increase_total_input_tokens
-from core.files import process_supplemental_files
-from core.rate_limiter import retry_with_backoff
+from core.files import process_supplemental_files, get_main_paper_part
+from core.rate_limiter import retry_with_backoff, TokenBucket
 
 __ENGINES : Dict[str, VertexEngine] = {}
 
-__API_LOCK: threading.Semaphore = threading.Semaphore(5)
+# The _check field names of AnalysisReport, introspected once at import time
+# instead of via vars() on every ask_final call. Sorted so the prompt stays
+# byte-stable across runs (implicit prefix caching relies on this).
+__CHECK_FIELDS: tuple = tuple(sorted(
+    key for key in AnalysisReport.model_fields if key.endswith("_check")))
+
+# Per-model concurrency caps. Flash endpoints have a higher QPS quota than
+# pro, so a single global semaphore either starves flash or floods pro.
+# BoundedSemaphore also catches accidental over-release.
+__MODEL_CONCURRENCY_LIMITS: Dict[str, int] = {"flash": 8, "pro": 4}
+__DEFAULT_CONCURRENCY_LIMIT: int = 5
+__API_LOCKS: Dict[str, threading.BoundedSemaphore] = {}
+__API_LOCKS_LOCK: threading.Lock = threading.Lock()
+
+
+def __get_api_lock(model_id: str) -> threading.BoundedSemaphore:
+    """
+    Returns (creating on first use) the concurrency semaphore for a model.
+
+    :param model_id: The model identifier whose quota the lock enforces.
+    :return: The shared BoundedSemaphore for that model.
+    """
+    lock = __API_LOCKS.get(model_id)
+    if lock is None:
+        with __API_LOCKS_LOCK:
+            lock = __API_LOCKS.get(model_id)
+            if lock is None:
+                limit = next((cap for family, cap in __MODEL_CONCURRENCY_LIMITS.items()
+                              if family in model_id), __DEFAULT_CONCURRENCY_LIMIT)
+                lock = __API_LOCKS[model_id] = threading.BoundedSemaphore(limit)
+    return lock
+
+# Global pacing for rate-limited sends: 5 requests/second, enforced before the
+# request instead of via a post-response sleep that held a semaphore slot.
+__RATE_BUCKET: TokenBucket = TokenBucket(rate=5.0)
+
+# Memoized engine.count_tokens results. The prompt parts for a submission are
+# identical across agents and retries, so the token count only has to be
+# computed once per (model, submission) instead of one RPC per agent call.
+__TOKEN_COUNTS: Dict[str, int] = {}
+__TOKEN_COUNTS_LOCK: threading.Lock = threading.Lock()
+
+
+def __is_valid_part(p: types.Part) -> bool:
+    """
+    Returns True for parts that carry actual content: non-blank text,
+    non-empty inline bytes, or a file URI reference.
+
+    :param p: The Part to check.
+    :return: Whether the part is worth sending/counting.
+    """
+    text = getattr(p, 'text', None)
+    inline_data = getattr(p, 'inline_data', None)
+    file_data = getattr(p, 'file_data', None)
+    return bool((text and text.strip())
+                or (inline_data and inline_data.data)
+                or (file_data and file_data.file_uri))
+
+
+def __quick_token_bound(parts: List[types.Part]) -> Optional[int]:
+    """
+    Cheap local estimate of the prompt token count: ~4 bytes/token for text.
+    Only text-only prompts are estimable: inline binary tokenizes by content,
+    not byte size (a PDF costs ~258 tokens per page whatever its byte count),
+    and uploaded-file parts have no local bytes at all, so either makes the
+    estimate unusable.
+
+    :param parts: The Parts to estimate.
+    :return: An approximate token count, or None if it cannot be estimated.
+    """
+    estimate = 0
+    for p in parts:
+        if getattr(p, 'file_data', None) and p.file_data.file_uri:
+            return None
+        inline_data = getattr(p, 'inline_data', None)
+        if inline_data and inline_data.data:
+            return None
+        text = getattr(p, 'text', None)
+        if text:
+            estimate += len(text) // 4
+    return estimate
+
+
+def __parts_fingerprint(parts: List[types.Part]) -> str:
+    """
+    Builds a content fingerprint for a parts list, used as the token-count
+    memo key when no submission-level key is available. Hashing runs at
+    memory bandwidth (blake2b), orders of magnitude cheaper than the
+    counting RPC it replaces.
+
+    :param parts: The Parts whose contents identify the prompt.
+    :return: A hex digest stable across calls with identical contents.
+    """
+    fingerprint = hashlib.blake2b(digest_size=16)
+    for p in parts:
+        text = getattr(p, 'text', None)
+        if text:
+            fingerprint.update(text.encode())
+        inline_data = getattr(p, 'inline_data', None)
+        if inline_data and inline_data.data:
+            fingerprint.update(inline_data.data)
+        file_data = getattr(p, 'file_data', None)
+        if file_data and file_data.file_uri:
+            fingerprint.update(file_data.file_uri.encode())
+    return fingerprint.hexdigest()
+
+# Explicit per-submission context caches. Every agent sees the same main paper
+# and supplemental files, so the documents are cached once on Vertex and
+# subsequent agents reference the cache instead of re-uploading the payload.
+# A None entry means cache creation was attempted and failed (do not retry).
+__SUBMISSION_CACHES: Dict[str, Optional[types.CachedContent]] = {}
+# The global lock only guards the dict and the per-key lock table; cache
+# creation itself (two network RPCs) runs under a per-key lock so parallel
+# submissions never serialize each other's cache setup.
+__SUBMISSION_CACHES_LOCK: threading.Lock = threading.Lock()
+__SUBMISSION_CACHE_KEY_LOCKS: Dict[str, threading.Lock] = {}
+__CACHE_MISS = object()  # sentinel: distinguishes "never looked up" from a stored None
+# Vertex rejects context caches below a minimum token count, and tiny prompts
+# are not worth the cache-management round-trips anyway.
+__MIN_CACHE_TOKENS = 2048
+
+
+def __get_submission_cache(engine: VertexEngine, submission_key: str, prompt_parts: List[types.Part],
+                           ttl_seconds: str) -> Optional[types.CachedContent]:
+    """
+    Returns (creating on first use) the shared document cache for a submission.
+
+    :param engine: The engine whose model the cache is created for.
+    :param submission_key: Stable key identifying the submission documents.
+    :param prompt_parts: The document parts to cache on a miss.
+    :param ttl_seconds: Time-to-live for the created cache.
+    :return: The CachedContent for the submission, or None if caching is not possible.
+    """
+    cache_key = f"{engine.model_id}:{submission_key}"
+    # Lock-free fast path for warm entries; the sentinel distinguishes a miss
+    # from a stored None (= creation already attempted and failed).
+    cached = __SUBMISSION_CACHES.get(cache_key, __CACHE_MISS)
+    if cached is not __CACHE_MISS:
+        return cached
+
+    with __SUBMISSION_CACHES_LOCK:
+        key_lock = __SUBMISSION_CACHE_KEY_LOCKS.setdefault(cache_key, threading.Lock())
+
+    # Only agents of the same submission wait here (for the one creation
+    # call); other submissions proceed under their own key's lock.
+    with key_lock:
+        with __SUBMISSION_CACHES_LOCK:
+            if cache_key in __SUBMISSION_CACHES:
+                return __SUBMISSION_CACHES[cache_key]
+
+        cache = None
+        try:
+            if engine.count_tokens(prompt_parts) > __MIN_CACHE_TOKENS:
+                LOG.info(f"Creating context cache for submission={submission_key}")
+                cache = engine.create_cache(
+                    contents=prompt_parts,
+                    display_name=f"sub-{os.path.basename(submission_key)}",
+                    ttl_seconds=ttl_seconds
+                )
+                register_cache(key=f"submission:{cache_key}", cache=cache)
+        except Exception as e:
+            LOG.warning(f"Could not create context cache for submission={submission_key}: {e}")
+
+        with __SUBMISSION_CACHES_LOCK:
+            __SUBMISSION_CACHES[cache_key] = cache
+        return cache
 
 
 def send_message_with_token_counting(engine: VertexEngine, message: Union[list[types.PartUnionDict], types.PartUnionDict],
-                                     config: Optional[types.GenerateContentConfigOrDict] = None, wait: bool = False) -> types.GenerateContentResponse:
+                                     config: Optional[types.GenerateContentConfig] = None, wait: bool = False) -> types.GenerateContentResponse:
 
     @retry_with_backoff
     def _send_with_retry():
         """Inner function to apply retry logic to engine.generate."""
-        with __API_LOCK:
-            response = engine.generate(contents=message)
-            if wait:
-                # Rate limit friendly delay: 5 req/sec = 200ms per request
-                time.sleep(0.2)
-            return response
-    
+        if wait:
+            # Rate limit friendly pacing: 5 req/sec enforced by the shared
+            # token bucket before the request, outside the semaphore, so
+            # waiting never blocks an in-flight slot.
+            __RATE_BUCKET.acquire()
+        with __get_api_lock(engine.model_id):
+            return engine.generate(contents=message, config=config)
+
     response = _send_with_retry()
 
     # add output tokens to the count
@@ -43,33 +210,61 @@ def send_message_with_token_counting(engine: VertexEngine, message: Union[list[t
     return response
 
 
-def send_message_with_cutting(engine: VertexEngine, prompt_parts: List[types.Part]) -> Optional[types.GenerateContentResponse]:
+def send_message_with_cutting(engine: VertexEngine, prompt_parts: List[types.Part],
+                              token_count_key: Optional[str] = None,
+                              config: Optional[types.GenerateContentConfig] = None) -> Optional[types.GenerateContentResponse]:
     """
     Sends a message to the model, sending only main paper pdf if it exceeds the token limit.
     Keeps removing parts from the end until the remaining content fits within the context window.
 
     :param engine: The engine containing model and configuration.
     :param prompt_parts: The list of Parts to send.
+    :param token_count_key: Optional stable key identifying the prompt contents. When provided,
+        the count_tokens result is memoized so repeated calls for the same submission
+        (multi-agent fanout, retries) skip the counting round-trip.
+    :param config: Optional per-call config passed through to the send (see VertexEngine.generate).
     :return: The response from the model.
     """
     limit = engine.get_model_limit()
 
-    valid_parts = [
-    p for p in prompt_parts 
-    if (getattr(p, 'text', None) and p.text.strip()) or getattr(p, 'inline_data', None) and len(p.inline_data.data) > 0
-    ]
-    try:
-        total_tokens = engine.count_tokens(valid_parts)
-    except errors.ClientError as e:
-        LOG.error(f"Token counting failed: {e}. Sending main paper only.")
-        total_tokens = limit + 1 # Force sending main paper only
+    valid_parts = [p for p in prompt_parts if __is_valid_part(p)]
+
+    if token_count_key is None:
+        # No submission-level key: fall back to a content hash so identical
+        # prompts (final-decision retries, cached-context sends) still hit
+        # the memo instead of repeating the counting RPC.
+        token_count_key = __parts_fingerprint(valid_parts)
+    token_count_key = f"{engine.model_id}:{token_count_key}"
+    # Lock-free read: the GIL makes single dict lookups atomic, so the
+    # lock is only needed on the insert path below.
+    total_tokens = __TOKEN_COUNTS.get(token_count_key)
+
+    if total_tokens is None:
+        # Skip the counting RPC for text-only prompts comfortably under the
+        # limit. The estimate is never trusted to declare a prompt over the
+        # limit (dense text like CJK tokenizes ~4x heavier than the bytes
+        # suggest), so anything borderline pays for an exact count.
+        estimate = __quick_token_bound(valid_parts)
+        if estimate is not None and estimate < limit * 0.7:
+            total_tokens = estimate
+
+    if total_tokens is None:
+        try:
+            total_tokens = engine.count_tokens(valid_parts)
+            with __TOKEN_COUNTS_LOCK:
+                __TOKEN_COUNTS.setdefault(token_count_key, total_tokens)
+        except errors.ClientError as e:
+            LOG.error(f"Token counting failed: {e}. Sending main paper only.")
+            total_tokens = limit + 1 # Force sending main paper only
 
     if total_tokens > limit:
         LOG.info(f"Prompt tokens ({total_tokens}) exceed limit ({limit}). Analyzing main_paper only")
 
-        return send_message_with_token_counting(engine=engine, message=prompt_parts[:2])
+        return send_message_with_token_counting(engine=engine, message=prompt_parts[:2], config=config)
     else:
-        return send_message_with_token_counting(engine=engine, message=prompt_parts)
+        # Send the filtered list: the counted tokens refer to valid_parts, and
+        # blank/empty parts only add request weight without content.
+        return send_message_with_token_counting(engine=engine, message=valid_parts, config=config)
 
 def ask_agent(pydantic_model: Type[pydantic.BaseModel], system_instruction: str,
               path_to_sub_dir: str,
@@ -107,18 +302,38 @@ def ask_agent(pydantic_model: Type[pydantic.BaseModel], system_instruction: str,
 
     # --- 2. Main Paper ---
     prompt_parts.append(types.Part.from_text(text="Here is the main_paper.pdf for the paper"))
-    with open(f"{path_to_sub_dir}/main_paper.pdf", "rb") as f:
-        prompt_parts.append(types.Part.from_bytes(
-            data=f.read(),
-            mime_type="application/pdf"
-        ))
+    prompt_parts.append(get_main_paper_part(f"{path_to_sub_dir}/main_paper.pdf"))
 
     # --- 3. Supplemental Files ---
     if not main_paper_only:
         supp_path = os.path.join(path_to_sub_dir, "supplemental_files")
         process_supplemental_files(supp_path, prompt_parts)
 
-    return send_message_with_cutting(engine, prompt_parts)
+    # --- 4. Context Caching ---
+    # Cache the submission documents once and let every agent reference the cache.
+    # Engines that already carry a style-guide cache or tools keep the inline path,
+    # since Vertex allows only one cache and no tools alongside cached content.
+    if not upload_style_guides and not search_included:
+        cache = __get_submission_cache(engine=engine, submission_key=f"{path_to_sub_dir}:{main_paper_only}",
+                                       prompt_parts=prompt_parts, ttl_seconds=ttl_seconds)
+        if cache:
+            # The cache is attached to a per-call copy of the config, never to
+            # the engine itself: engines are shared per schema across threads,
+            # and mutating engine.config here would let a concurrent agent
+            # generate against another submission's cached documents.
+            # Cached content cannot be combined with a config-level system
+            # instruction, so the instruction travels as the first message part
+            # (same approach create_engine uses for the style-guide cache).
+            call_config = engine.config.model_copy()
+            call_config.system_instruction = None
+            call_config.cached_content = cache.name
+            return send_message_with_cutting(engine, [
+                types.Part.from_text(text=system_instruction),
+                types.Part.from_text(text="Analyze the cached submission documents according to your role.")
+            ], config=call_config)
+
+    return send_message_with_cutting(engine, prompt_parts,
+                                     token_count_key=f"{path_to_sub_dir}:{main_paper_only}")
 
 def ask_final(analysis_report: AnalysisReport,
               system_instruction: str = "",
@@ -144,15 +359,18 @@ def ask_final(analysis_report: AnalysisReport,
                                system_instruction=system_instruction, thinking_included=thinking_included,
                                search_included=search_included)
         __ENGINES[FinalDecision.__name__] = engine
-        engine.set_temperature(temp=0.0)
 
     prompt_parts: List[types.Part] = list()
 
-    for key, val in vars(analysis_report).items():
-        if key.endswith("_check"):
-            prompt_parts.append(types.Part.from_text(
-                text=f"Here is the result of {key}:\n{val}\n"
-            ))
+    # One StringIO-built Part with model_dump_json() per check avoids the
+    # repeated str(pydantic_obj) formatting and the per-check Part overhead.
+    report_buf = io.StringIO()
+    for key in __CHECK_FIELDS:
+        val = getattr(analysis_report, key)
+        report_buf.write(f"Here is the result of {key}:\n")
+        report_buf.write(val.model_dump_json() if val is not None else "None")
+        report_buf.write("\n\n")
+    prompt_parts.append(types.Part.from_text(text=report_buf.getvalue()))
 
     return send_message_with_cutting(engine, prompt_parts)
 
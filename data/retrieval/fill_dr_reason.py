@@ -1,4 +1,9 @@
 SUBMISSIONS_CSV_PATH = "../iclr/data/submissions.csv"
+# Rows per classification request: keeps each prompt far below the context
+# limit and gives retries/failures per-chunk granularity.
+CHUNK_SIZE = 200
+
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 from pydantic import BaseModel, ConfigDict
@@ -10,15 +15,15 @@ load_dotenv(dotenv_path="../../google.env", verbose=True)
 
 from core.config import VertexEngine
 
-submissions_df = pd.read_csv(SUBMISSIONS_CSV_PATH)
-
-dr_reason = submissions_df["desk_reject_comments"]
+# Only the comments column is needed for classification; the full table is
+# loaded later, just for the write-back.
+dr_reason = pd.read_csv(SUBMISSIONS_CSV_PATH, usecols=["desk_reject_comments"])["desk_reject_comments"]
 
 engine = VertexEngine(model_id="gemini-2.5-pro")
 
 engine.set_system_instruction(
     """
-    You will be given a column from the .csv file which specifies the reason for desk-rejection or <null> if it was not a desk reject
+    You will be given CSV data with columns "idx,reason" where reason specifies the reason for desk-rejection or is empty if it was not a desk reject
     Your task is to classify them according to categories("Code_of_Ethics", "Anonymity", "Formatting", "Visual_Integrity", "Policy", "Scope") of desk rejection or None if it wasn't a desk rejection.
     
     Now here is which reasons count to corresponding categories:
@@ -29,7 +34,7 @@ engine.set_system_instruction(
     * Policy : "Placeholder_Text", "Dual_Submission", "Plagiarism"
     * Scope: "Scope", "Language"
     
-    Ignore all the NaNs at the input, but return the index for each classified category(The corresponding indices from the input value)
+    Ignore all the rows with an empty reason, but return the idx for each classified category(The corresponding idx values from the input rows)
     categories and indices attributes must have the same length.
     """
 )
@@ -40,11 +45,25 @@ class DRCategorizationResults(BaseModel):
 
 engine.set_schema(schema=DRCategorizationResults)
 
-cat_results = engine.generate(contents=[types.Part.from_text(
-        text=dr_reason.to_string()
+def classify_chunk(chunk: pd.Series) -> DRCategorizationResults:
+    """Classifies one batch of reasons; the serialized idx column keeps labels global."""
+    # CSV is far more compact than to_string(): no padding/alignment whitespace.
+    cat_results = engine.generate(contents=[types.Part.from_text(
+        text=chunk.reset_index().to_csv(index=False, header=['idx', 'reason'])
     )])
+    return cat_results.parsed
+
+chunks = [dr_reason.iloc[start:start + CHUNK_SIZE] for start in range(0, len(dr_reason), CHUNK_SIZE)]
 
-indices, categories = cat_results.parsed.indices, cat_results.parsed.categories
+with ThreadPoolExecutor(max_workers=5, thread_name_prefix="DRCategorization") as executor:
+    results = list(executor.map(classify_chunk, chunks))
+
+indices, categories = [], []
+for result in results:
+    indices.extend(result.indices)
+    categories.extend(result.categories)
+
+submissions_df = pd.read_csv(SUBMISSIONS_CSV_PATH)
 
 submissions_df["category"] = None
 
@@ -1,27 +1,68 @@
 import random
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 import openreview.api
 
 from typing import Optional, List, Dict, Any
 from data.retrieval.util.threading import num_workers
 
-def get_note_value(note: openreview.api.Note, field: str = "") -> Optional[str]:
-    """Safely extracts the string 'value' from a nested note content dictionary."""
-    return note.content.get(field, {}).get('value', None)
+# Shared fallback for hoisted content lookups in the hot filter loops.
+_EMPTY: Dict[str, Any] = {}
 
-def filter_proper_desk_rejections(client: openreview.api.OpenReviewClient, initial_desk_rejections: List[openreview.api.Note]) -> List[Dict[str, Any]]:
+
+@dataclass(slots=True)
+class SubmissionRecord:
+    """Flat, typed view of a kept submission.
+
+    The filters walk the nested note content dicts exactly once to build
+    this record; the download loop then reads plain attributes instead of
+    repeating get_note_value chains per field.
+    """
+    id: str
+    title: Optional[str]
+    supplementary_material: Optional[str]
+    desk_reject_comments: Optional[str] = None
+
+def get_note_value(note, field: str = "") -> Optional[str]:
+    """Safely extracts the string 'value' from a nested note content dictionary.
+
+    Accepts both Note objects and the raw reply dicts returned by
+    ``details='directReplies'`` bulk queries.
+    """
+    content = note.get('content', {}) if isinstance(note, dict) else note.content
+    return content.get(field, {}).get('value', None)
+
+
+def get_direct_replies(client: openreview.api.OpenReviewClient, submission: openreview.api.Note) -> List[Any]:
+    """Returns the direct replies of a submission.
+
+    Uses the replies prefetched by a ``details='directReplies'`` bulk query
+    when present, and only falls back to a per-submission replyto round trip
+    when they are not.
+    """
+    if submission.details:
+        replies = submission.details.get('directReplies')
+        if replies is not None:
+            return replies
+    return client.get_all_notes(replyto=submission.id, details='content')
+
+def filter_proper_desk_rejections(client: openreview.api.OpenReviewClient, initial_desk_rejections: List[openreview.api.Note]) -> List[SubmissionRecord]:
     submissions_to_process = []
-    for i, submission in enumerate(initial_desk_rejections):
 
-        # 1. Check for mandatory PDF path
-        pdf_path = get_note_value(submission, 'pdf')
+    def __check_desk_rejection(submission: openreview.api.Note) -> Optional[SubmissionRecord]:
+        # Hoist the content dict once per note: the checks below would
+        # otherwise re-resolve note.content through several call frames each.
+        content = submission.content
+        pdf_path = (content.get('pdf') or _EMPTY).get('value')
 
+        # 1. Check for mandatory PDF path
         if pdf_path is None:
-            print(f"Desk Rejected Submission: ❌ Skipping Submission ID {submission.id} and {submission.content["title"]}: No main PDF path found.")
-            continue
+            title = (content.get('title') or _EMPTY).get('value')
+            print(f"Desk Rejected Submission: ❌ Skipping Submission ID {submission.id} and {title}: No main PDF path found.")
+            return None
 
         # 2. Check for mandatory desk reject comment existence (metadata check)
-        comment_notes = client.get_all_notes(replyto=submission.id, details='content')
+        comment_notes = get_direct_replies(client=client, submission=submission)
         desk_reject_notes = []
 
         for note in comment_notes:
@@ -33,13 +74,32 @@ def filter_proper_desk_rejections(client: openreview.api.OpenReviewClient, initi
         if len(desk_reject_notes) != 1:
             # If 0 (no reason found) or >1 (ambiguous), skip the submission
             print(f"Desk Rejected Submission: ❌ Skipping Submission ID {submission.id}: Found {len(desk_reject_notes)} desk reject notes (must be exactly 1).")
-            continue
+            return None
 
-        # If all checks pass, add the note and its corresponding comment note to the processing list
-        submissions_to_process.append({
-            'submission': submission,
-            'comment_note': desk_reject_notes[0], # If we reached this point, exactly one valid desk_reject_note was found.
-        })
+        # If all checks pass, flatten the note (and its single valid desk
+        # reject comment) into the typed record the download loop consumes.
+        return SubmissionRecord(
+            id=submission.id,
+            title=(content.get('title') or _EMPTY).get('value'),
+            supplementary_material=(content.get('supplementary_material') or _EMPTY).get('value'),
+            desk_reject_comments=get_note_value(note=desk_reject_notes[0], field="desk_reject_comments"),
+        )
+
+    # The checks are I/O-bound only when a submission lacks prefetched
+    # directReplies, but that fallback round trip is exactly what the pool
+    # overlaps; prefetched submissions cost a dict lookup either way.
+    with ThreadPoolExecutor(max_workers=num_workers(), thread_name_prefix="DR-filtering-") as executor:
+        future_map = {executor.submit(__check_desk_rejection, sub): sub for sub in initial_desk_rejections}
+        for future in as_completed(future_map):
+            try:
+                result = future.result()
+            except Exception as e:
+                sub = future_map[future]
+                print(f"Desk Rejected Submission: ❌ Skipping Submission ID {sub.id}: worker error: {e}")
+                continue
+
+            if result is not None:
+                submissions_to_process.append(result)
 
     return submissions_to_process
 
@@ -48,57 +108,63 @@ def filter_proper_accepted_papers(
     initial_accepted_papers: List[openreview.api.Note],
     dr_submissions_count: int,
     desk_rejection_ids: Optional[List[str]] = None,
-    withdrawal_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    withdrawal_ids: Optional[List[str]] = None) -> List[SubmissionRecord]:
     # Remove any papers that are desk-rejected or withdrawn (moved from iclr_2025_main.py)
     try:
-        excluded_ids = set(desk_rejection_ids or []) | set(withdrawal_ids or [])
+        # frozenset: immutable for the loop's lifetime, slightly cheaper probes.
+        excluded_ids = frozenset(desk_rejection_ids or []) | frozenset(withdrawal_ids or [])
     except Exception:
-        excluded_ids = set()
+        excluded_ids = frozenset()
 
     if excluded_ids:
-        all_unique_forum_ids = {note.forum for note in initial_accepted_papers}
-        ndr_unique_forum_ids = all_unique_forum_ids - excluded_ids
-        initial_accepted_papers = [
+        filtered_accepted_papers = [
             note for note in initial_accepted_papers
-            if (note.forum not in excluded_ids and note.id not in excluded_ids)
+            if excluded_ids.isdisjoint((note.forum, note.id))
         ]
-        removed = len(all_unique_forum_ids) - len(ndr_unique_forum_ids)
+        removed = len(initial_accepted_papers) - len(filtered_accepted_papers)
+        initial_accepted_papers = filtered_accepted_papers
         if removed:
             print(
                 f"Filtered out {removed} submissions due to desk-rejection/withdrawal before processing accepted."
             )
 
-    submissions_to_process: List[Dict[str, Any]] = []
+    # Algorithm R reservoir: holds at most the sample size, so memory stays
+    # O(k) instead of accumulating every valid accepted paper before sampling.
+    MAX_NDR_SAMPLE_SIZE = 3 * dr_submissions_count
+    submissions_to_process: List[SubmissionRecord] = []
+    valid_candidates_seen = 0
+
+    def __process_accepted_paper(submission: openreview.api.Note) -> Optional[SubmissionRecord]:
+        # Hoist the content dict once per note (see filter_proper_desk_rejections).
+        content = submission.content
+        pdf_path = (content.get('pdf') or _EMPTY).get('value')
+        title = (content.get('title') or _EMPTY).get('value')
 
-    def __process_accepted_paper(submission: openreview.api.Note) -> Optional[Dict[str, Any]]:
         # 1. Check for mandatory PDF path
-
-        pdf_path = get_note_value(submission, 'pdf')
         if pdf_path is None:
-            print(f"Not Desk Rejected Submission:❌ Skipping Submission ID {submission.id} and {submission.content['title']}: No main PDF path found.")
+            print(f"Not Desk Rejected Submission:❌ Skipping Submission ID {submission.id} and {title}: No main PDF path found.")
             return None
 
 
-        # 2. Fetch related notes and check for decision
+        # 2. Fetch related notes and check for decision. Prefetched
+        # directReplies make this a local lookup; only submissions without
+        # them fall back to a per-submission round trip.
         try:
-            comment_notes = client.get_all_notes(replyto=submission.id, details='content')
+            comment_notes = get_direct_replies(client=client, submission=submission)
         except Exception as e:
             print(f"Not Desk Rejected Submission:❌ Skipping Submission ID {submission.id}: failed to fetch comment notes: {e}")
             return None
 
-        has_decision = False
-        for note in comment_notes:
-            if get_note_value(note=note, field="decision"):
-                has_decision = True
-                break
+        has_decision = any(get_note_value(note=note, field="decision") for note in comment_notes)
 
         if has_decision:
-            return {
-                'submission': submission,
-                'comment_note': None
-            }
+            return SubmissionRecord(
+                id=submission.id,
+                title=title,
+                supplementary_material=(content.get('supplementary_material') or _EMPTY).get('value'),
+            )
         else:
-            print(f"Not Desk Rejected Submission:❌ Skipping Submission ID {submission.id} and {submission.content['title']}: No Decision Note found.")
+            print(f"Not Desk Rejected Submission:❌ Skipping Submission ID {submission.id} and {title}: No Decision Note found.")
             return None
 
     with ThreadPoolExecutor(max_workers=num_workers(), thread_name_prefix=f"NDR-filtering-") as executor:
@@ -113,17 +179,16 @@ def filter_proper_accepted_papers(
                 continue
 
             if result is not None:
-                submissions_to_process.append(result)
-
-    MAX_NDR_SAMPLE_SIZE = 3 * dr_submissions_count
-    current_ndr_count = len(submissions_to_process)
-    if current_ndr_count > MAX_NDR_SAMPLE_SIZE:
-        random.shuffle(submissions_to_process)
-
-        # b. Sample the required number of items from the shuffled list
-        submissions_to_process = submissions_to_process[:MAX_NDR_SAMPLE_SIZE]
-
-        print(f"Sampling Applied: Original NDR count ({current_ndr_count}) > Max allowed ({MAX_NDR_SAMPLE_SIZE}).")
+                if valid_candidates_seen < MAX_NDR_SAMPLE_SIZE:
+                    submissions_to_process.append(result)
+                else:
+                    replace_at = random.randint(0, valid_candidates_seen)
+                    if replace_at < MAX_NDR_SAMPLE_SIZE:
+                        submissions_to_process[replace_at] = result
+                valid_candidates_seen += 1
+
+    if valid_candidates_seen > MAX_NDR_SAMPLE_SIZE:
+        print(f"Sampling Applied: Original NDR count ({valid_candidates_seen}) > Max allowed ({MAX_NDR_SAMPLE_SIZE}).")
         print(f"Final NDR sample size: {len(submissions_to_process)}")
 
     return submissions_to_process
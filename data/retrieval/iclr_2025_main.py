@@ -1,12 +1,16 @@
 import os
-from threading import Barrier
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import List
 
 import openreview.api
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+from core.log import LOG, configure_logging
 from data.retrieval.helper import filter_proper_desk_rejections, filter_proper_accepted_papers
 from data.retrieval.storage import process_single_submission, write_to_csv
+from data.retrieval.util.threading import num_workers
 
 
 load_dotenv(verbose=True)
@@ -15,86 +19,140 @@ PASSWORD = os.getenv("USER_PASSWORD")
 BASE_URL = "https://api2.openreview.net"
 CONFERENCE_ID = 'ICLR.cc/2025/Conference'
 
-DESK_REJECTION_IDS = []
-WITHDRAWAL_IDS = []
-ACCEPTED_RETREVING_BARRIER = Barrier(3) # 2 for rejection and withdrawal and 1 for accepted
-final_csv_data = [] # --- Global Data Structure for CSV Output ---
 
-def main_rejection(client: openreview.api.OpenReviewClient) -> None:
-    global DESK_REJECTION_IDS, ACCEPTED_RETREVING_BARRIER
+def fetch_desk_rejections(client: openreview.api.OpenReviewClient) -> List[openreview.api.Note]:
     DESK_REJECT_INVITATION = f'{CONFERENCE_ID}/-/Desk_Rejected_Submission'
 
-    # 1. Get all Notes posted using the correct master list invitation
-    initial_desk_rejections = client.get_all_notes(
+    # Get all Notes posted using the correct master list invitation.
+    # directReplies piggybacks the desk-reject comment notes on this single
+    # bulk query, so the filter below does not need one replyto round trip
+    # per submission.
+    return client.get_all_notes(
         invitation=DESK_REJECT_INVITATION,
-        details='content'
+        details='content,directReplies'
     )
-    DESK_REJECTION_IDS = [submission.forum for submission in initial_desk_rejections]
-    ACCEPTED_RETREVING_BARRIER.wait()
-    print(f"\n--- Processing initial desk rejects ---")
-    submissions_to_process = filter_proper_desk_rejections(client=client, initial_desk_rejections=initial_desk_rejections)
-
-    print(f"\n--- Starting Download and Processing for {len(submissions_to_process)} Valid DR-Submissions ---")
 
-    # Process each submission individually to avoid holding the GIL for long loops
-    for item in submissions_to_process:
-        process_single_submission(client=client, item=item, csv_data=final_csv_data, desk_rejection=True)
 
-
-
-def main_accepted(client: openreview.api.OpenReviewClient) -> None:
-    global DESK_REJECTION_IDS, WITHDRAWAL_IDS
+def fetch_accepted_notes(client: openreview.api.OpenReviewClient) -> List[openreview.api.Note]:
     ACCEPTED_INVITATION = f'{CONFERENCE_ID}/-/Submission'
 
-    initial_accepted_papers = []
-    initial_accepted_papers += client.get_all_notes(
+    # directReplies piggybacks the decision notes on this single bulk query,
+    # so filter_proper_accepted_papers can check for a decision with a local
+    # lookup instead of one replyto round trip per submission.
+    return client.get_all_notes(
         invitation=ACCEPTED_INVITATION,
-        details='content'
+        details='content,directReplies'
     )
 
-    ACCEPTED_RETREVING_BARRIER.wait()
+
+def fetch_withdrawal_ids(client: openreview.api.OpenReviewClient) -> List[str]:
+    WITHDRAWN_INVITATION = f'{CONFERENCE_ID}/-/Withdrawn_Submission'
+    withdrawals = client.get_all_notes(
+        invitation=WITHDRAWN_INVITATION,
+        details='id'
+    )
+
+    return [withdrawal.id for withdrawal in withdrawals]
+
+
+def process_rejections(client: openreview.api.OpenReviewClient,
+                       desk_rejections_future: "Future[List[openreview.api.Note]]") -> None:
+    initial_desk_rejections = desk_rejections_future.result()
+    print(f"\n--- Processing initial desk rejects ---")
+    submissions_to_process = filter_proper_desk_rejections(client=client, initial_desk_rejections=initial_desk_rejections)
+
+    print(f"\n--- Starting Download and Processing for {len(submissions_to_process)} Valid DR-Submissions ---")
+
+    # The per-submission downloads are independent blocking GETs; fanning
+    # them out over IO-sized workers overlaps the HTTP latency. Futures are
+    # collected so a submission that dies outside process_single_submission's
+    # own error handling is logged instead of vanishing silently.
+    with ThreadPoolExecutor(max_workers=num_workers(), thread_name_prefix="DR-download-") as download_pool:
+        future_map = {download_pool.submit(process_single_submission, client=client, item=item,
+                                           desk_rejection=True): item
+                      for item in submissions_to_process}
+        for future in as_completed(future_map):
+            try:
+                future.result()
+            except Exception as e:
+                LOG.error(f"Download failed for DR submission {future_map[future].id}: {e}")
+
+
+def process_accepted(client: openreview.api.OpenReviewClient,
+                     accepted_future: "Future[List[openreview.api.Note]]",
+                     desk_rejections_future: "Future[List[openreview.api.Note]]",
+                     withdrawal_ids_future: "Future[List[str]]") -> None:
+    initial_accepted_papers = accepted_future.result()
+    # The id-sets are only needed here, at the filtering step, so the
+    # accepted fetch above overlaps the rejection/withdrawal fetches instead
+    # of blocking on a barrier until both finish.
+    desk_rejection_ids = [submission.forum for submission in desk_rejections_future.result()]
+    withdrawal_ids = withdrawal_ids_future.result()
+
     print(f"\n--- Processing initially not desk rejects ---")
     submissions_to_process = filter_proper_accepted_papers(
         client=client,
         initial_accepted_papers=initial_accepted_papers,
-        dr_submissions_count=len(DESK_REJECTION_IDS),
-        desk_rejection_ids=DESK_REJECTION_IDS,
-        withdrawal_ids=WITHDRAWAL_IDS,
+        dr_submissions_count=len(desk_rejection_ids),
+        desk_rejection_ids=desk_rejection_ids,
+        withdrawal_ids=withdrawal_ids,
     )
 
     print(f"\n--- Starting Download and Processing for {len(submissions_to_process)} Valid NDR-Submissions ---")
 
-    # Process each submission individually to avoid holding the GIL for long loops
-    for item in submissions_to_process:
-        process_single_submission(client=client, item=item, csv_data=final_csv_data, desk_rejection=False, is_reference=True)
-
-def main_withdrawal(client: openreview.api.OpenReviewClient) -> None:
-    global WITHDRAWAL_IDS, ACCEPTED_RETREVING_BARRIER
-    WITHDRAWN_INVITATION = f'{CONFERENCE_ID}/-/Withdrawn_Submission'
-    withdrawals = client.get_all_notes(
-        invitation=WITHDRAWN_INVITATION,
-        details='id'
-    )
+    # Same IO-bound fanout (and future collection) as the desk-rejected phase.
+    with ThreadPoolExecutor(max_workers=num_workers(), thread_name_prefix="NDR-download-") as download_pool:
+        future_map = {download_pool.submit(process_single_submission, client=client, item=item,
+                                           desk_rejection=False, is_reference=True): item
+                      for item in submissions_to_process}
+        for future in as_completed(future_map):
+            try:
+                future.result()
+            except Exception as e:
+                LOG.error(f"Download failed for NDR submission {future_map[future].id}: {e}")
 
-    WITHDRAWAL_IDS += [withdrawal.id for withdrawal in withdrawals]
-    ACCEPTED_RETREVING_BARRIER.wait()
 
 if __name__ == "__main__":
+    configure_logging("INFO")
+
     client = openreview.api.OpenReviewClient(
         baseurl=BASE_URL,
         username=USER_NAME,
         password=PASSWORD
     )
 
-    with ThreadPoolExecutor(max_workers=3) as executor:
-        # we execute a functions in a concurrent way for two reasons:
+    # Widen the underlying requests pool: the default adapter keeps ~10
+    # connections, so concurrent download workers would otherwise reopen
+    # TCP+TLS for most small transfers. Sized to the sum of the worker
+    # pools that share this session (two download phases plus the doubled
+    # fetch executor in storage.py) so sockets and threads agree. Transient
+    # gateway errors retry at the transport layer with backoff instead of
+    # failing the submission.
+    if hasattr(client, "session"):
+        client.session.mount("https://", HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=4 * num_workers(),
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+        ))
+        client.session.headers.pop("Connection", None)
+
+    # The fetches and the two processing phases run concurrently; the
+    # processing tasks block on exactly the Futures they need instead of a
+    # 3-way Barrier over shared globals. Records stream straight to the
+    # on-disk CSV as submissions finish, so nothing accumulates in memory
+    # during the long download loops.
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        # we execute the functions in a concurrent way for two reasons:
         # 1. it is faster(download takes incredibly long)
         # 2. it will randomize the entries of the papers
-        executor.submit(main_rejection, client)
-        executor.submit(main_withdrawal, client)
-        executor.submit(main_accepted, client)
-
+        dr_future = executor.submit(fetch_desk_rejections, client)
+        wd_future = executor.submit(fetch_withdrawal_ids, client)
+        accepted_future = executor.submit(fetch_accepted_notes, client)
 
-    write_to_csv(csv_data=final_csv_data)
+        dr_csv_future = executor.submit(process_rejections, client, dr_future)
+        ndr_csv_future = executor.submit(process_accepted, client, accepted_future, dr_future, wd_future)
 
+        dr_csv_future.result()
+        ndr_csv_future.result()
 
+    write_to_csv()
@@ -1,33 +1,84 @@
 import openreview.api
 import csv
+import io
 import os
 import shutil
+import threading
 import urllib.parse
 import zipfile
-from typing import Optional, List, Dict, Any
+from typing import Optional, List
 from openreview import OpenReviewException
 from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
 
-from helper import get_note_value
+from core.log import LOG
+from helper import SubmissionRecord
 from util.attachments import get_attachment
+from util.threading import num_workers
+
+# One long-lived worker pool for download timeouts: spawning a fresh
+# single-worker executor per file paid thread create/teardown twice per
+# submission. Sized to the IO worker count so the per-phase download
+# fanout never starves waiting for a fetch slot.
+__DOWNLOAD_EXECUTOR = ThreadPoolExecutor(max_workers=2 * num_workers(), thread_name_prefix="ovr-download")
+
+CSV_FILENAME = "data/iclr/data/submissions.csv"
+CSV_FIELDNAMES = ['material_id', 'directory_name', 'status', 'desk_reject_comments', 'supplemental_downloaded']
+
+# Records stream straight to disk as they complete. The download loops run
+# for hours; with every row written immediately, a crash keeps all but the
+# last unflushed batch and peak memory stays O(1) in the record count.
+__CHECKPOINT_PATH = CSV_FILENAME + ".partial"
+__CHECKPOINT_LOCK = threading.Lock()
+__CHECKPOINT_FILE = None
+__CHECKPOINT_WRITER = None
+__CHECKPOINT_ROWS_WRITTEN = 0
+__CHECKPOINT_ROWS_SINCE_FLUSH = 0
+__CHECKPOINT_FLUSH_EVERY = 32
+
+
+def append_submission_record(record: tuple) -> None:
+    """Appends one processed record to the on-disk checkpoint CSV.
+
+    The checkpoint file is opened lazily on first use and flushed every few
+    rows, so a crashed run keeps all but the last partial batch. write_to_csv
+    promotes the file to the authoritative submissions.csv at the end.
+    """
+    global __CHECKPOINT_FILE, __CHECKPOINT_WRITER, __CHECKPOINT_ROWS_WRITTEN, __CHECKPOINT_ROWS_SINCE_FLUSH
 
+    with __CHECKPOINT_LOCK:
+        try:
+            if __CHECKPOINT_WRITER is None:
+                os.makedirs(os.path.dirname(__CHECKPOINT_PATH), exist_ok=True)
+                __CHECKPOINT_FILE = open(__CHECKPOINT_PATH, 'w', newline='', encoding='utf-8')
+                __CHECKPOINT_WRITER = csv.writer(__CHECKPOINT_FILE)
+                __CHECKPOINT_WRITER.writerow(CSV_FIELDNAMES)
+
+            __CHECKPOINT_WRITER.writerow(record)
+            __CHECKPOINT_ROWS_WRITTEN += 1
+            __CHECKPOINT_ROWS_SINCE_FLUSH += 1
+            if __CHECKPOINT_ROWS_SINCE_FLUSH >= __CHECKPOINT_FLUSH_EVERY:
+                __CHECKPOINT_FILE.flush()
+                __CHECKPOINT_ROWS_SINCE_FLUSH = 0
+        except Exception as e:
+            LOG.warning(f"Could not checkpoint CSV record: {e}")
 
-def download_file(client: openreview.api.OpenReviewClient,
-                  note_id: Optional[str],
-                  field_name: Optional[str] = "",
-                  output_path: str = "main.pdf",
-                  is_pdf: bool = False,
-                  timeout: float = 30.,
-                  is_reference: bool = False) -> bool:
-    """Download a single file using the already-instantiated OpenReview client with a hard timeout.
+
+def fetch_file(client: openreview.api.OpenReviewClient,
+               note_id: Optional[str],
+               field_name: Optional[str] = "",
+               is_pdf: bool = False,
+               timeout: float = 30.,
+               is_reference: bool = False) -> Optional[bytes]:
+    """Fetch a single file into memory using the already-instantiated OpenReview client with a hard timeout.
 
     We execute the OpenReview API call in a worker thread and wait up to `timeout` seconds.
-    On timeout or error, we skip and return False. Only after a successful fetch do we write to disk.
+    On timeout or error, we skip and return None. The caller decides whether the
+    bytes go to disk or are consumed directly (e.g., in-memory archive extraction).
     """
 
     if not note_id:
-        print("    ❌ Missing note_id for download")
-        return False
+        LOG.error("Missing note_id for download")
+        return None
 
     def _fetch() -> bytes:
         if is_pdf:
@@ -43,153 +94,261 @@ def download_file(client: openreview.api.OpenReviewClient,
             else:
                 return client.get_attachment(id=[note_id], field_name=field_name)
 
-    with ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"download_{note_id}") as executor:
-        future = executor.submit(_fetch)
-        try:
-            data: bytes = future.result(timeout=timeout)
-        except FuturesTimeout:
-            print(f"    ⏱️ Download Timed Out after {timeout}s for {field_name or 'pdf'} of note {note_id}. Skipping.")
-            return False
-        except OpenReviewException as e:
-            print(f"    ❌ OpenReview error during download of {field_name or 'pdf'} for note {note_id}: {e}")
-            return False
-        except Exception as e:
-            print(f"    ❌ Unexpected error during download of {field_name or 'pdf'} for note {note_id}: {e}")
-            return False
+    future = __DOWNLOAD_EXECUTOR.submit(_fetch)
+    try:
+        data: bytes = future.result(timeout=timeout)
+    except FuturesTimeout:
+        LOG.warning(f"Download Timed Out after {timeout}s for {field_name or 'pdf'} of note {note_id}. Skipping.")
+        return None
+    except OpenReviewException as e:
+        LOG.error(f"OpenReview error during download of {field_name or 'pdf'} for note {note_id}: {e}")
+        return None
+    except Exception as e:
+        LOG.error(f"Unexpected error during download of {field_name or 'pdf'} for note {note_id}: {e}")
+        return None
+
+    return data
+
+
+def download_file(client: openreview.api.OpenReviewClient,
+                  note_id: Optional[str],
+                  field_name: Optional[str] = "",
+                  output_path: str = "main.pdf",
+                  is_pdf: bool = False,
+                  timeout: float = 30.,
+                  is_reference: bool = False) -> bool:
+    """Download a single file to disk. Thin wrapper over fetch_file that only
+    writes after a successful fetch."""
 
-    # Ensure parent directory exists and write file only after successful fetch
+    data = fetch_file(client=client, note_id=note_id, field_name=field_name,
+                      is_pdf=is_pdf, timeout=timeout, is_reference=is_reference)
+    if data is None:
+        return False
+
+    # Ensure the write happens only after a successful fetch
     try:
         with open(output_path, "wb") as f:
             f.write(data)
     except Exception as e:
-        print(f"    ❌ Failed to write output file '{output_path}': {e}")
+        LOG.error(f"Failed to write output file '{output_path}': {e}")
         return False
 
     return True
 
 
-def process_single_submission(client: openreview.api.OpenReviewClient, item: Dict[str, Any], csv_data: List[Dict[str, Any]],
+def __extract_zip(zip_ref: zipfile.ZipFile, target_dir: str) -> None:
+    """Extracts an open archive into target_dir with large copy buffers.
+
+    extractall copies each member through a 16 KB buffer; streaming the
+    members ourselves with 1 MiB buffers cuts the write syscall count on
+    small-file-heavy supplemental archives. Directories are created once
+    from the set of unique parents instead of per member.
+    """
+    members = [info for info in zip_ref.infolist() if not info.is_dir()]
+
+    # Members that would escape the target directory are skipped outright.
+    safe_members = []
+    for info in members:
+        if os.path.isabs(info.filename) or ".." in info.filename.split("/"):
+            LOG.warning(f"Skipping unsafe archive member {info.filename!r}")
+            continue
+        safe_members.append(info)
+
+    for parent in {os.path.dirname(f"{target_dir}/{info.filename}") for info in safe_members}:
+        os.makedirs(parent, exist_ok=True)
+
+    for info in safe_members:
+        with zip_ref.open(info) as src, open(f"{target_dir}/{info.filename}", "wb", buffering=1 << 20) as dst:
+            shutil.copyfileobj(src, dst, length=1 << 20)
+
+
+def process_single_submission(client: openreview.api.OpenReviewClient, item: SubmissionRecord,
                               desk_rejection: bool = False, timeout: float = 30.0, is_reference: bool = False) -> None:
     """Process a single submission using the latest revision/edit."""
 
-    # item['submission'] here is expected to be the 'Note' from the last edit
-    # as per your previous function logic.
-    submission = item['submission']
-    comment_note = item['comment_note']
-    material_id = submission.id
+    # item here is the flat SubmissionRecord built by the filter pass: all
+    # note content has already been extracted, so this function only reads
+    # attributes.
+    material_id = item.id
 
     # --- 1. Identify if we are dealing with an Edit/Revision ---
     # We fetch edits to find the specific 'Edit ID' needed for 'is_reference' downloads
     if is_reference:
         note_edits = client.get_note_edits(note_id=material_id, sort='tmdate:desc')
         if not note_edits:
-            print(f"No edits found for {material_id}. Proceeding with download of the pdf.")
+            LOG.info(f"No edits found for {material_id}. Proceeding with download of the pdf.")
             is_reference=False
         else:
             # The latest edit ID is what we use as the 'id' parameter in get_pdf/get_attachment
             # when is_reference is True.
             material_id = note_edits[-1].id
-            print(f"Submission_id is {submission.id} is changed for {material_id}")
+            LOG.info(f"Submission_id is {item.id} is changed for {material_id}")
 
-    title = get_note_value(submission, 'title')
     dir_name = f"submission_{material_id}"
     base_dir = f"data/iclr/data/{dir_name}"
 
-    os.makedirs(base_dir, exist_ok=True)
+    # --- Idempotent resume: skip submissions a previous run completed ---
+    # The atomic staging rename guarantees base_dir only exists fully
+    # populated, so its presence (with a non-empty PDF) means all the
+    # downloads can be skipped on a rerun.
+    existing_pdf = f"{base_dir}/main_paper.pdf"
+    if os.path.isfile(existing_pdf) and os.path.getsize(existing_pdf) > 0:
+        # Mirror the download path's flag exactly: zip/pdf supplementals land
+        # in supplemental_files/, but other extensions are kept at the
+        # base_dir root as supplemental_archive{ext} and count too.
+        existing_supplemental_dir = f"{base_dir}/supplemental_files"
+        has_supplemental = (
+            (os.path.isdir(existing_supplemental_dir) and bool(os.listdir(existing_supplemental_dir)))
+            or any(entry.startswith("supplemental_archive") for entry in os.listdir(base_dir))
+        )
+        record = (
+            material_id,
+            base_dir,
+            'Desk Rejected' if desk_rejection else "Not Desk Rejected",
+            item.desk_reject_comments if desk_rejection else "",
+            has_supplemental
+        )
+        append_submission_record(record)
+        LOG.info(f"Submission {item.id} already on disk at {base_dir}. Skipping download.")
+        return None
 
-    # --- 2. Download Main PDF (Using Edit ID as reference) ---
-    pdf_filename = os.path.join(base_dir, f"main_paper.pdf")
+    # Stage everything into a sibling directory and only rename to the final
+    # path once the submission is complete: a crash mid-download never leaves
+    # a half-populated submission directory behind, and a supplemental
+    # failure no longer throws away an already-downloaded PDF.
+    staging_dir = f"{base_dir}.staging"
 
+    # --- 2. Download Main PDF (Using Edit ID as reference) ---
     # Note: We pass last_edit_id instead of submission_id because is_reference=True
     # requires the ID of the Edit/Revision record.
-    print(f'Attempting to download main_paper.pdf for submission={submission.id}')
-    if not download_file(client, material_id, 'pdf', pdf_filename, is_pdf=True,
-                         timeout=timeout, is_reference=is_reference):
-        shutil.rmtree(base_dir, ignore_errors=True)
+    # The PDF is fetched before any directory exists: failed downloads
+    # (restricted papers are common) then cost zero filesystem churn
+    # instead of a makedirs+rmtree pair per failure.
+    LOG.info(f'Attempting to download main_paper.pdf for submission={item.id}')
+    pdf_data = fetch_file(client, material_id, 'pdf', is_pdf=True,
+                          timeout=timeout, is_reference=is_reference)
+    if pdf_data is None:
+        return None
+
+    os.makedirs(staging_dir, exist_ok=True)
+    pdf_filename = f"{staging_dir}/main_paper.pdf"
+    try:
+        with open(pdf_filename, "wb") as f:
+            f.write(pdf_data)
+    except Exception as e:
+        LOG.error(f"Failed to write output file '{pdf_filename}': {e}")
+        shutil.rmtree(staging_dir, ignore_errors=True)
         return None
+    del pdf_data
 
     # --- 3. Download Supplementary Material ---
-    supplementary_material_path = get_note_value(submission, 'supplementary_material')
+    supplementary_material_path = item.supplementary_material
     supplemental_downloaded = False
 
-    print(f'Attempting to download supplemental files for submission={submission.id}')
+    LOG.info(f'Attempting to download supplemental files for submission={item.id}')
     if supplementary_material_path:
         parsed_path = urllib.parse.urlparse(supplementary_material_path).path
         _, file_ext = os.path.splitext(os.path.basename(parsed_path))
-        temp_filename = os.path.join(base_dir, f"supplemental_archive{file_ext}")
+        # Lowercased once; the branches below compare against this.
+        ext = file_ext.lower()
 
-        # Download supplemental using the Edit ID reference
-        supplemental_download_successful = download_file(
+        # Fetch the supplemental into memory using the Edit ID reference:
+        # archives are extracted straight from RAM, skipping the
+        # write-then-reopen disk round trip for the biggest files.
+        supplemental_data = fetch_file(
             client,
             material_id,  # Reference the specific edit
             'supplementary_material',
-            temp_filename,
             is_pdf=False,
             timeout=timeout,
             is_reference=is_reference
         )
 
-        if not supplemental_download_successful:
-            print(f"⚠️ Supplemental download failed for {submission.id} at revision {material_id}")
-            shutil.rmtree(base_dir, ignore_errors=True)
-            return None
+        if supplemental_data is None:
+            # The PDF (the slow download) is kept; the CSV records the
+            # missing supplemental via supplemental_downloaded=False.
+            LOG.warning(f"Supplemental download failed for {item.id} at revision {material_id}. Keeping main paper.")
         else:
             # --- Download Succeeded (Proceed with File Management) ---
-            supplemental_dir = os.path.join(base_dir, "supplemental_files")
+            supplemental_dir = f"{staging_dir}/supplemental_files"
             # Create subdirectory for extraction
             os.makedirs(supplemental_dir, exist_ok=True)
             supplemental_downloaded = True # Mark for CSV logging
 
             # Handle Extraction (ZIP/TAR/TGZ)
-            if file_ext.lower() == '.zip':
+            if ext == '.zip':
                 try:
-                    with zipfile.ZipFile(temp_filename, 'r') as zip_ref:
-                        zip_ref.extractall(supplemental_dir)
+                    with zipfile.ZipFile(io.BytesIO(supplemental_data)) as zip_ref:
+                        __extract_zip(zip_ref, supplemental_dir)
 
-                    print(f"    📦 Extracted {file_ext.upper()} into {supplemental_dir}.")
-                    os.remove(temp_filename)
+                    LOG.info(f"Extracted {file_ext.upper()} into {supplemental_dir}.")
 
                 except Exception as e:
-                    print(f"    ❌ Error extracting archive: {e}. Keeping original archive in supplemental_files.")
-                    # Move unextracted archive to subdirectory
-                    shutil.move(temp_filename, os.path.join(supplemental_dir, f"supplemental_archive{file_ext}"))
+                    LOG.error(f"Error extracting archive: {e}. Keeping original archive in supplemental_files.")
+                    # Persist the unextracted archive to the subdirectory
+                    with open(f"{supplemental_dir}/supplemental_archive{file_ext}", "wb") as f:
+                        f.write(supplemental_data)
 
-            elif file_ext.lower() == ".pdf":
-                # If it's a single PDF/other file, just move it to the subdirectory
-                shutil.move(temp_filename, os.path.join(supplemental_dir, f"supplemental{file_ext}"))
+            elif ext == ".pdf":
+                # If it's a single PDF file, just write it to the subdirectory
+                with open(f"{supplemental_dir}/supplemental{file_ext}", "wb") as f:
+                    f.write(supplemental_data)
 
-    # --- 4. Record CSV Data ---
-    csv_data.append({
-        'material_id': material_id,
-        'directory_name': base_dir,
-        'status': 'Desk Rejected' if desk_rejection else "Not Desk Rejected",
-        'desk_reject_comments': comment_note.content["desk_reject_comments"]["value"] if desk_rejection else "",
-        'supplemental_downloaded': supplemental_downloaded
-    })
+            else:
+                # Unknown archive types keep the original on-disk layout.
+                with open(f"{staging_dir}/supplemental_archive{file_ext}", "wb") as f:
+                    f.write(supplemental_data)
 
+    # --- Promote the fully staged directory to its final path ---
+    shutil.rmtree(base_dir, ignore_errors=True)
+    os.rename(staging_dir, base_dir)
 
-def store_main_and_supplemental_materials(client: openreview.api.OpenReviewClient,submissions_to_process: List[Dict[str, Any]], csv_data: List[Dict[str, Any]], desk_rejection: bool = False, timeout: float = 30.0) -> None:
+    # --- 4. Record CSV Data ---
+    # Plain tuples in CSV_FIELDNAMES order: csv.writer skips the per-row
+    # dict-to-list mapping DictWriter would pay on every record. The row
+    # goes straight to the on-disk CSV instead of a shared in-memory list.
+    record = (
+        material_id,
+        base_dir,
+        'Desk Rejected' if desk_rejection else "Not Desk Rejected",
+        item.desk_reject_comments if desk_rejection else "",
+        supplemental_downloaded
+    )
+    append_submission_record(record)
+
+
+def store_main_and_supplemental_materials(client: openreview.api.OpenReviewClient,submissions_to_process: List[SubmissionRecord], desk_rejection: bool = False, timeout: float = 30.0) -> None:
     """Backward-compatible wrapper that processes a list by delegating to process_single_submission.
 
     Prefer calling process_single_submission in the caller's loop to reduce long-held GIL segments.
     """
     for item in submissions_to_process:
-        process_single_submission(client=client, item=item, csv_data=csv_data, desk_rejection=desk_rejection, timeout=timeout)
+        process_single_submission(client=client, item=item, desk_rejection=desk_rejection, timeout=timeout)
 
 
-def write_to_csv(csv_data: List[Dict[str, Any]]) -> None:
-
-    CSV_FILENAME = "data/iclr/data/submissions.csv"
-    if csv_data:
-        csv_fieldnames = ['material_id', 'directory_name', 'status', 'desk_reject_comments', 'supplemental_downloaded']
+def write_to_csv() -> None:
+    """Promotes the streamed partial CSV to the final submissions.csv.
 
+    Every record was already written (and periodically flushed) as its
+    submission finished, so finishing a run is a close plus one rename
+    instead of rewriting the whole table from memory.
+    """
+    global __CHECKPOINT_FILE, __CHECKPOINT_WRITER
+
+    with __CHECKPOINT_LOCK:
+        if __CHECKPOINT_FILE is not None:
+            try:
+                __CHECKPOINT_FILE.close()
+            except Exception:
+                pass
+            __CHECKPOINT_FILE = None
+            __CHECKPOINT_WRITER = None
+
+    if __CHECKPOINT_ROWS_WRITTEN:
         try:
-            with open(CSV_FILENAME, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=csv_fieldnames)
-                writer.writeheader()
-                writer.writerows(csv_data)
-            print(f"\n🎉 Successfully created final analysis CSV: **{CSV_FILENAME}** with {len(csv_data)} records.")
-        except Exception as e:
-            print(f"\n❌ Error writing final CSV file: {e}")
+            os.replace(__CHECKPOINT_PATH, CSV_FILENAME)
+            LOG.info(f"Successfully created final analysis CSV: **{CSV_FILENAME}** with {__CHECKPOINT_ROWS_WRITTEN} records.")
+        except OSError as e:
+            LOG.error(f"Error writing final CSV file: {e}")
     else:
-        print("\n⚠️ No valid submissions were processed for final CSV output.")
\ No newline at end of file
+        LOG.warning("No valid submissions were processed for final CSV output.")
\ No newline at end of file
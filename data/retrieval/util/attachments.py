@@ -4,22 +4,24 @@ from openreview import OpenReviewException
 import openreview.api
 
 def format_params(params):
-    if isinstance(params, dict):
-        formatted_params = {}
-        for key, value in params.items():
-            formatted_params[key] = format_params(value)
-        return formatted_params
-
-    if isinstance(params, list):
-        formatted_params = []
-        for value in params:
-            formatted_params.append(format_params(value))
-        return formatted_params
-
+    # Scalar fast path first: this runs once per HTTP request and the real
+    # payloads are a handful of scalar values, so the common case should not
+    # recurse at all. bool must be checked before the early return because
+    # it is the only scalar that needs rewriting.
     if isinstance(params, bool):
         return json.dumps(params)
 
-    return params
+    if not isinstance(params, (dict, list)):
+        return params
+
+    if isinstance(params, dict):
+        # All-primitive dicts (the usual shape) pass through unchanged
+        # instead of being rebuilt key by key.
+        if all(not isinstance(value, (dict, list, bool)) for value in params.values()):
+            return params
+        return {key: format_params(value) for key, value in params.items()}
+
+    return [format_params(value) for value in params]
 
 def __handle_response(response):
     try:
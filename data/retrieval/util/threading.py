@@ -2,14 +2,31 @@ import os
 from multiprocessing import cpu_count
 
 
-def num_workers() -> int:
+def num_workers(io_bound: bool = True, host_concurrency_cap: int = 16) -> int:
     """
     Returns the number of workers for tasks executed in parallel.
 
+    For IO-bound work (the default) the useful concurrency is bounded by how
+    many connections the remote host tolerates, not by the core count: on a
+    large box cpus*2 would open enough sockets to swamp the server and turn
+    into 503 retries. The result can be overridden with the DDR_MAX_WORKERS
+    environment variable.
+
+    :param io_bound: Whether the workers mostly wait on network/disk IO
+    :param host_concurrency_cap: Upper bound for IO-bound worker counts
     :return: The number of workers to use
     """
+    override = os.getenv("DDR_MAX_WORKERS")
+    if override:
+        try:
+            return max(1, int(override))
+        except ValueError:
+            pass
+
     cpus = __get_core_count()
-    return cpus * 2  # Our tasks are very much IO bound
+    if io_bound:
+        return min(host_concurrency_cap, max(4, cpus * 2))
+    return cpus
 
 
 def __get_core_count() -> int:
@@ -24,6 +24,7 @@ AVAILABLE_SYSTEMS = [
     'ddr-think-search'
     'sasp', #single agent single prompt
     'sacp', # single agent multiple prompt
+    'sabp', # single agent batched prompt (all checks in one call)
 ]
 
 def ensure_authenticated():
@@ -123,6 +124,9 @@ class DeskRejectionCLI:
             case 'sacp':
                 from systems.sacp import sacp
                 desk_rejection_system = sacp
+            case 'sabp':
+                from systems.sabp import sabp
+                desk_rejection_system = sabp
             case 'ddr-1-iteration':
                 def __run_ddr_1_iteration(path_sub_dir: Union[os.PathLike, str], main_paper_only: bool = False, think: bool = False, search: bool = False) -> SubmissionMetrics:
                     return ddr(path_sub_dir=path_sub_dir, think=think, search=search, iterations=1, ttl_seconds="10800s", main_paper_only=main_paper_only)
@@ -138,7 +142,12 @@ class DeskRejectionCLI:
                     return ddr(path_sub_dir=path_sub_dir, think=think, search=search, ttl_seconds="10800s", main_paper_only=main_paper_only)
 
                 desk_rejection_system = __run_ddr_default
-        subdirs = [os.path.join(directory, d) for d in os.listdir(directory) if os.path.isdir(os.path.join(directory, d))]
+        # scandir caches the dirent type from the directory read itself, so
+        # enumerating submissions costs one getdents pass instead of a stat
+        # per entry. Symlinks are followed (only they pay a stat), matching
+        # the os.path.isdir semantics this replaced.
+        with os.scandir(directory) as entries:
+            subdirs = [entry.path for entry in entries if entry.is_dir()]
         
         # Use balanced selection if requested
         if balanced:
@@ -14,6 +14,7 @@ from core.rate_limiter import RateLimitError
 # Import Agents
 from agents import final_decision_agent
 from agents.utils import AGENT_MAPPING
+import atexit
 import os
 import concurrent.futures
 
@@ -21,6 +22,18 @@ import concurrent.futures
 # Model configuration
 MODEL_ID = "gemini-2.5-flash"
 
+# One executor shared across every ddr() invocation: a batch run over many
+# submissions otherwise pays thread spawn/teardown per paper and loses any
+# per-thread connection reuse to the model endpoint. Sized for a full agent
+# fan-out per concurrent submission (evaluate_desk_rejection --parallel runs
+# up to 3 papers at once), so one paper's agents never queue behind
+# another's.
+__MAX_CONCURRENT_SUBMISSIONS = 3
+__AGENT_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=len(AGENT_MAPPING) * __MAX_CONCURRENT_SUBMISSIONS,
+    thread_name_prefix="AgentThread")
+atexit.register(__AGENT_EXECUTOR.shutdown)
+
 
 def ddr(path_sub_dir: Union[os.PathLike, str], think: bool = False, search: bool = False, iterations: int = 3, ttl_seconds: str = "300s", main_paper_only: bool = False) -> Optional[SubmissionMetrics]:
     """
@@ -59,62 +72,62 @@ def ddr(path_sub_dir: Union[os.PathLike, str], think: bool = False, search: bool
     agent_errors : Dict[str, Optional[Dict[str, str]]] = {key: None for key in AGENT_MAPPING.keys()}  # Store errors per agent
     agent_iteration_results : Dict[str, List[Dict[str, Any]]] = {key: [] for key in AGENT_MAPPING.keys()}  # Track all iterations
     start_time = time.time()
-    for iteration in range(MAX_ITERATIONS):
-        
-        # Identify agents that still need to be run
-        agents_to_run = {}
-        for key, result in agent_results.items():
-            if result is None or result.confidence_score < CONFIDENCE_THRESHOLD:
-                agents_to_run[key] = AGENT_MAPPING[key]
-        
-        if not agents_to_run:
-            LOG.info("All agents satisfied confidence threshold.")
-            break
-        LOG.info(f"--- Iteration {iteration + 1} ---")
-        LOG.info(f"Running agents: {list(agents_to_run.keys())}")
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5, thread_name_prefix="AgentThread") as executor:
-            future_to_agent = {
-                executor.submit(func, path_sub_dir, main_paper_only,
-                                MODEL_ID, search, think,
-                                ttl_seconds): key 
-                for key, func in agents_to_run.items()
-            }
-
-            for future in concurrent.futures.as_completed(future_to_agent):
-                agent_name = future_to_agent[future]
-                try:
-                    response = future.result()
-                    # The response is a GenerateContentResponse, we need the parsed object
-                    parsed_response = response.parsed
-
-                    # Compute logprob-based confidence score and substitute it
-                    agent_schema = AGENT_SCHEMAS.get(agent_name)
-                    if agent_schema:
-                        new_confidence = combine_confidences(response, agent_schema)
-                        parsed_response.confidence_score = new_confidence
-                        LOG.debug(f"Substituted {agent_name} confidence with logprob-based score: {new_confidence}")
-
-                    # Record this iteration's result
-                    iteration_result = {
-                        "result": parsed_response.violation_found,
-                        "evidence_snippet": parsed_response.evidence_snippet,
-                        "confidence" : parsed_response.confidence_score
-                    }
-                    agent_iteration_results[agent_name].append(iteration_result)
-                    LOG.debug(f"{agent_name} iteration {iteration + 1} result: {iteration_result}")
-
-                    # Update only if confidence is higher or if it's the first result
-                    if agent_results[agent_name] is None or parsed_response.confidence_score > agent_results[agent_name].confidence_score:
-                        agent_results[agent_name] = parsed_response
-                        agent_errors[agent_name] = None  # Clear error if successful
-                        LOG.debug(f"{agent_name} updated with confidence {parsed_response.confidence_score}.")
-                    else:
-                        LOG.debug(f"{agent_name} current confidence ({parsed_response.confidence_score}) is not higher than existing ({agent_results[agent_name].confidence_score}). Keeping existing.")
-
-                except Exception as exc:
-                    LOG.error(f"{agent_name} generated an exception: {exc}")
-                    agent_results[agent_name] = None
+    # Retries are greedy per agent: the moment a result comes back below the
+    # confidence threshold that single agent is resubmitted, instead of a
+    # whole iteration round waiting on its slowest member before any agent
+    # may retry. Wall clock is bounded by the worst agent's own attempts
+    # rather than the sum of per-round maxima.
+    def __submit(key: str) -> "concurrent.futures.Future":
+        return __AGENT_EXECUTOR.submit(AGENT_MAPPING[key], path_sub_dir, main_paper_only,
+                                       MODEL_ID, search, think, ttl_seconds)
+
+    attempts: Dict[str, int] = {key: 1 for key in AGENT_MAPPING.keys()}
+    pending = {__submit(key): key for key in AGENT_MAPPING.keys()}
+    LOG.info(f"Running agents: {list(AGENT_MAPPING.keys())}")
+
+    while pending:
+        done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            agent_name = pending.pop(future)
+            try:
+                response = future.result()
+                # The response is a GenerateContentResponse, we need the parsed object
+                parsed_response = response.parsed
+
+                # Compute logprob-based confidence score and substitute it
+                agent_schema = AGENT_SCHEMAS.get(agent_name)
+                if agent_schema:
+                    new_confidence = combine_confidences(response, agent_schema)
+                    parsed_response.confidence_score = new_confidence
+                    LOG.debug(f"Substituted {agent_name} confidence with logprob-based score: {new_confidence}")
+
+                # Record this attempt's result
+                iteration_result = {
+                    "result": parsed_response.violation_found,
+                    "evidence_snippet": parsed_response.evidence_snippet,
+                    "confidence" : parsed_response.confidence_score
+                }
+                agent_iteration_results[agent_name].append(iteration_result)
+                LOG.debug(f"{agent_name} attempt {attempts[agent_name]} result: {iteration_result}")
+
+                # Update only if confidence is higher or if it's the first result
+                if agent_results[agent_name] is None or parsed_response.confidence_score > agent_results[agent_name].confidence_score:
+                    agent_results[agent_name] = parsed_response
+                    agent_errors[agent_name] = None  # Clear error if successful
+                    LOG.debug(f"{agent_name} updated with confidence {parsed_response.confidence_score}.")
+                else:
+                    LOG.debug(f"{agent_name} current confidence ({parsed_response.confidence_score}) is not higher than existing ({agent_results[agent_name].confidence_score}). Keeping existing.")
+
+            except Exception as exc:
+                LOG.error(f"{agent_name} generated an exception: {exc}")
+                agent_results[agent_name] = None
+
+            # Resubmit immediately while other agents keep running.
+            best = agent_results[agent_name]
+            if (best is None or best.confidence_score < CONFIDENCE_THRESHOLD) and attempts[agent_name] < MAX_ITERATIONS:
+                attempts[agent_name] += 1
+                LOG.info(f"Re-running {agent_name} (attempt {attempts[agent_name]}/{MAX_ITERATIONS}).")
+                pending[__submit(agent_name)] = agent_name
 
     # Ensure all results are present, even if some failed (fallback or re-raise)
     submission_error_type = None
@@ -142,12 +155,11 @@ def ddr(path_sub_dir: Union[os.PathLike, str], think: bool = False, search: bool
             result.confidence_score = None
             LOG.debug(f"Set confidence_score to None for {key}")
 
-    analysis_report = AnalysisReport(
-        anonymity_check=agent_results.get("anonymity_check"),
-        formatting_check=agent_results.get("formatting_check"),
-        policy_check=agent_results.get("policy_check"),
-        scope_check=agent_results.get("scope_check")
-    )
+    # agent_results is keyed by the AnalysisReport field names and holds
+    # already-validated schema instances (guaranteed non-None by the
+    # failed_agents check above), so model_construct can skip the per-field
+    # validator dispatch of a normal construction.
+    analysis_report = AnalysisReport.model_construct(**agent_results)
 
     final_decision_response = final_decision_agent.ask_final_decision_agent(analysis_report=analysis_report, model_id=MODEL_ID,
                                                                             search_included=search, thinking_included=think)
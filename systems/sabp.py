@@ -0,0 +1,111 @@
+from typing import Union, Optional
+import os
+import time
+from google.genai import types
+
+from core.schemas import AnalysisReport, FinalDecision
+from core.logprobs import combine_confidences
+from core.metrics import SubmissionMetrics, get_total_input_tokens, get_total_output_tokens
+from core.utils import ask_agent
+from core.log import LOG
+from agents import final_decision_agent
+
+# Model configuration
+MODEL_ID = "gemini-2.5-flash"
+
+SABP_SYSTEM_PROMPT = """
+Identity: You are the full ICLR desk-rejection audit board, producing all four specialist reports in one pass.
+
+Task: Audit the submitted paper (main_paper.pdf and any supplemental files) and fill in EVERY check of the report:
+
+1. **anonymity_check** (Double-Blind Review)
+   - Author names or affiliations, identifying links, self-citations revealing identity, visual cues such as logos.
+   Sub-categories: "Author_Names", "Visual_Anonymity", "Self-Citation", "Links"
+
+2. **formatting_check** (Document Compliance)
+   - Page limits for the main content, statement limits, margin/font cheating, missing line numbers.
+   Sub-categories: "Page_Limit", "Statement_Limit", "Margins/Spacing", "Line_Numbers"
+
+3. **policy_check** (Conference Integrity)
+   - Placeholder text (Lorem Ipsum), plagiarism or dual-submission indicators.
+   Sub-categories: "Placeholder_Text", "Plagiarism"
+
+4. **scope_check** (Domain Relevance & Language)
+   - Alignment with ICLR's ML/AI scope, professional language quality.
+   Sub-categories: "Scope", "Language"
+
+Output Requirements:
+- Every check must be filled independently, as if produced by a dedicated specialist.
+- For each check set `violation_found`, the most fitting `issue_type` (or "None"), an `evidence_snippet` quoting the paper, and clear `reasoning`.
+- Do not let a violation in one area bias the other checks.
+- Return a JSON object matching the AnalysisReport schema.
+"""
+
+
+def ask_batched_audit_agent(path_to_sub_dir: str, model_id: str = MODEL_ID, main_paper_only: bool = False,
+                            search_included: bool = False, thinking_included: bool = False) -> types.GenerateContentResponse:
+    """Send the single batched audit request covering all four checks."""
+    return ask_agent(pydantic_model=AnalysisReport, system_instruction=SABP_SYSTEM_PROMPT,
+                     path_to_sub_dir=path_to_sub_dir, model_id=model_id,
+                     main_paper_only=main_paper_only,
+                     search_included=search_included, thinking_included=thinking_included)
+
+
+def sabp(path_sub_dir: Union[os.PathLike, str], main_paper_only: bool = False,
+         think: bool = False, search: bool = False) -> Optional[SubmissionMetrics]:
+    """
+    Single Agent Batched Prompt (SABP) system for desk rejection.
+
+    Runs all four auditor checks in ONE generation call by binding the engine
+    to the AnalysisReport schema directly, then forwards the report to the
+    final decision agent. Compared to the ddr fanout this amortizes the shared
+    context (paper, supplementals, instructions) across every check: one round
+    trip and one upload of the documents instead of one per agent.
+
+    :param path_sub_dir: Path to the directory containing 'main_paper.pdf' and supplemental files.
+    :param main_paper_only: If True, skips processing the supplemental files directory.
+    :param think: Boolean flag to enable Gemini's 'thinking' (reasoning) capabilities.
+    :param search: Boolean flag to enable Google Search grounding.
+    :return: A SubmissionMetrics object containing the final decision, compatible with evaluate_submission_full.
+    """
+    LOG.info(f"--- Starting SABP (Single Agent Batched Prompt) for submission={path_sub_dir} ---")
+
+    start_time = time.time()
+
+    try:
+        response = ask_batched_audit_agent(path_to_sub_dir=str(path_sub_dir), model_id=MODEL_ID,
+                                           main_paper_only=main_paper_only, search_included=search,
+                                           thinking_included=think)
+
+        analysis_report: AnalysisReport = response.parsed
+
+        final_decision_response = final_decision_agent.ask_final_decision_agent(analysis_report=analysis_report,
+                                                                                model_id=MODEL_ID,
+                                                                                search_included=search,
+                                                                                thinking_included=think)
+        final_decision_response.parsed.confidence_score = combine_confidences(llm_response=final_decision_response,
+                                                                              pydantic_scheme=FinalDecision,
+                                                                              final_agent=True)
+
+        LOG.info(f"SABP decision: {final_decision_response.parsed.desk_reject_decision} "
+                 f"(Categories: {final_decision_response.parsed.categories})")
+
+        return SubmissionMetrics(
+            final_decision=final_decision_response.parsed,
+            total_input_token_count=get_total_input_tokens(),
+            total_output_token_count=get_total_output_tokens(),
+            total_elapsed_time=time.time() - start_time
+        )
+
+    except Exception as e:
+        LOG.error(f"Error during SABP evaluation: {e}")
+        return SubmissionMetrics(
+            submission_id=str(path_sub_dir),
+            system_name="SABP",
+            total_elapsed_time=time.time() - start_time,
+            total_input_token_count=get_total_input_tokens(),
+            total_output_token_count=get_total_output_tokens(),
+            error_type=str(e),
+            error_message=str(e),
+            confidence_score=0.0
+        )